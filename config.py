@@ -1,8 +1,11 @@
 import os
 from dotenv import load_dotenv
 
-# Load environment variables from .env file (for local development)
-load_dotenv()
+# Load environment variables from .env file (for local development).
+# The sentinel lets child processes inherit the parsed values instead of re-reading .env
+if not os.environ.get('_DOTENV_LOADED'):
+    load_dotenv()
+    os.environ['_DOTENV_LOADED'] = '1'
 
 class Config:
     """Configuration class for the application"""
@@ -12,6 +15,12 @@ class Config:
     SUPABASE_KEY = os.getenv('SUPABASE_KEY') 
     SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
     
+    # Supavisor pooler in transaction mode, for direct (non-REST) Postgres access, e.g.
+    # postgresql://postgres.<project-ref>:<password>@aws-0-<region>.pooler.supabase.com:6543/postgres
+    SUPABASE_POOLER_URL = os.getenv('SUPABASE_POOLER_URL')
+    POOL_MIN_SIZE = 1
+    POOL_MAX_SIZE = 10
+    
     # App configuration
     DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
     APP_NAME = "Task Manager API"
@@ -21,26 +30,22 @@ class Config:
     API_VERSION = "v1"
     MAX_TASKS_PER_REQUEST = 100
     
-    # CORS configuration
-    ALLOWED_ORIGINS = [
+    # CORS configuration. Streamlit cannot set HTTP response headers, so these must be
+    # applied by the reverse proxy / edge in front of the app (e.g. nginx add_header)
+    ALLOWED_ORIGINS = frozenset({
         "http://localhost:3000",
         "http://localhost:8080", 
         "https://your-frontend-domain.com",
         "*"  # Remove this in production
-    ]
+    })
+    
+    # Settings that must be present for the app to start
+    _REQUIRED = ('SUPABASE_URL', 'SUPABASE_KEY')
     
     @classmethod
     def validate_config(cls):
         """Validate that required configuration is present"""
-        required_vars = [
-            'SUPABASE_URL',
-            'SUPABASE_KEY'
-        ]
-        
-        missing_vars = []
-        for var in required_vars:
-            if not getattr(cls, var):
-                missing_vars.append(var)
+        missing_vars = [var for var in cls._REQUIRED if not getattr(cls, var)]
         
         if missing_vars:
             raise ValueError(f"Missing required configuration: {', '.join(missing_vars)}")
@@ -49,6 +54,10 @@ class Config:
 
 # Database table schemas for reference
 TASKS_SCHEMA = """
+-- Direct connections should go through the Supavisor pooler (port 6543, transaction mode)
+-- with a small client pool (Config.POOL_MIN_SIZE / POOL_MAX_SIZE) and prepared statement
+-- caching disabled.
+
 CREATE TABLE tasks (
   id SERIAL PRIMARY KEY,
   title TEXT NOT NULL,
@@ -58,11 +67,27 @@ CREATE TABLE tasks (
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
--- Create an index on created_at for better performance
-CREATE INDEX idx_tasks_created_at ON tasks(created_at DESC);
+-- Create an index matching the (created_at, id) list order for better performance
+CREATE INDEX idx_tasks_created_at ON tasks(created_at DESC, id DESC);
+
+-- Partial indexes for status-filtered listings, newest first
+CREATE INDEX idx_tasks_pending_created ON tasks(created_at DESC, id DESC) WHERE completed = FALSE;
+CREATE INDEX idx_tasks_done_created ON tasks(created_at DESC, id DESC) WHERE completed = TRUE;
+
+-- Full-text search vector over title + description, served by a GIN index
+ALTER TABLE tasks ADD COLUMN search TSVECTOR
+  GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(title, '') || ' ' || COALESCE(description, ''))) STORED;
+CREATE INDEX idx_tasks_search ON tasks USING GIN(search);
 
--- Create an index on completed status
-CREATE INDEX idx_tasks_completed ON tasks(completed);
+-- Aggregate task counts server-side (called via POST /rest/v1/rpc/task_stats)
+CREATE OR REPLACE FUNCTION task_stats()
+RETURNS TABLE(total BIGINT, completed BIGINT, pending BIGINT)
+LANGUAGE SQL STABLE AS $$
+  SELECT COUNT(*),
+         COUNT(*) FILTER (WHERE completed),
+         COUNT(*) FILTER (WHERE NOT completed)
+  FROM tasks;
+$$;
 
 -- Enable Row Level Security (RLS)
 ALTER TABLE tasks ENABLE ROW LEVEL SECURITY;
@@ -73,7 +98,7 @@ FOR ALL USING (true);
 """
 
 # Sample data for testing
-SAMPLE_DATA = [
+SAMPLE_DATA = (
     {
         "title": "Setup Supabase Database",
         "description": "Create tables and configure RLS policies",
@@ -99,4 +124,4 @@ SAMPLE_DATA = [
         "description": "Implement user login and authorization",
         "completed": False
     }
-]
+)
@@ -1,7 +1,65 @@
 import streamlit as st
-import requests
-import json
-from typing import List, Dict, Optional
+import httpx
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple, Union
+from urllib.parse import quote
+from config import Config
+
+# Connect / overall timeouts (seconds) for Supabase REST calls
+REQUEST_TIMEOUT = httpx.Timeout(10.0, connect=3.0)
+CONNECTION_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=40)
+
+# Columns needed by the list view and stats; avoids pulling unused columns
+TASK_FIELDS = "id,title,description,completed,created_at"
+DEFAULT_TASK_LIMIT = 100
+TASK_PAGE_SIZE = 50
+# id breaks ties between rows inserted in one transaction (same NOW() timestamp)
+TASK_ORDER = "created_at.desc,id.desc"
+
+# Prebuilt PostgREST endpoint templates for hot paths; variable parts are filled per call
+# Every endpoint projects TASK_FIELDS so the generated search column never reaches callers
+_TASKS = f"tasks?select={TASK_FIELDS}"
+_TASK_BY_ID = (_TASKS + "&id=eq.{}").format
+_TASKS_BY_IDS = (_TASKS + "&id=in.({})").format
+_TASK_SEARCH = ("tasks?search=plfts(simple).{}&select=" + TASK_FIELDS
+                + f"&order={TASK_ORDER}&limit={TASK_PAGE_SIZE}").format
+_HOME_TASKS = f"tasks?select={TASK_FIELDS}&order={TASK_ORDER}&limit={DEFAULT_TASK_LIMIT}"
+
+# Worker threads for issuing independent reads in parallel on the pooled client
+_BUNDLE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="supabase")
+
+def _build_client(base_url: str, headers: Dict) -> httpx.Client:
+    """Create a keep-alive HTTP/2 client that multiplexes requests over one connection"""
+    return httpx.Client(
+        base_url=base_url,
+        headers=headers,
+        timeout=REQUEST_TIMEOUT,
+        # Retries cover connection failures only; HTTP error statuses are surfaced as-is
+        transport=httpx.HTTPTransport(http2=True, limits=CONNECTION_LIMITS, retries=3)
+    )
+
+async def create_pg_pool(dsn: Optional[str] = None, min_size: int = Config.POOL_MIN_SIZE,
+                         max_size: int = Config.POOL_MAX_SIZE):
+    """Create an asyncpg pool against the Supavisor transaction-mode pooler"""
+    import asyncpg  # Only needed for direct Postgres access, not the REST client
+    
+    dsn = dsn or Config.SUPABASE_POOLER_URL
+    if not dsn:
+        raise ValueError("Missing required configuration: SUPABASE_POOLER_URL")
+    
+    # Transaction mode hands each transaction to any backend, so prepared
+    # statements cannot be cached client-side
+    return await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size, statement_cache_size=0)
+
+def stats_from_counts(total: int, completed: int) -> Dict:
+    """Build the task statistics payload from raw counts"""
+    return {
+        "total": total,
+        "completed": completed,
+        "pending": total - completed,
+        "completion_rate": (completed / total * 100) if total > 0 else 0
+    }
 
 class SupabaseClient:
     def __init__(self):
@@ -15,6 +73,8 @@ class SupabaseClient:
                 "apikey": self.key,
                 "Authorization": f"Bearer {self.key}",
                 "Content-Type": "application/json",
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, br",
                 "Prefer": "return=representation"
             }
             
@@ -22,42 +82,91 @@ class SupabaseClient:
                 "apikey": self.service_key,
                 "Authorization": f"Bearer {self.service_key}",
                 "Content-Type": "application/json",
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, br",
                 "Prefer": "return=representation"
             }
             
+            # Reuse HTTP/2 connections across calls instead of reconnecting each time
+            rest_url = f"{self.url}/rest/v1/"
+            self.client = _build_client(rest_url, self.headers)
+            self.admin_client = _build_client(rest_url, self.admin_headers)
+            
         except KeyError as e:
             st.error(f"Missing Supabase configuration: {e}")
             raise
     
-    def _make_request(self, method: str, endpoint: str, data: Dict = None, use_admin: bool = False) -> requests.Response:
-        """Make HTTP request to Supabase API"""
-        url = f"{self.url}/rest/v1/{endpoint}"
-        headers = self.admin_headers if use_admin else self.headers
+    def _make_request(self, method: str, endpoint: str, data: Union[Dict, List[Dict]] = None, use_admin: bool = False,
+                      headers: Optional[Dict] = None) -> httpx.Response:
+        """Make HTTP request to Supabase API; headers are merged over the client defaults"""
+        client = self.admin_client if use_admin else self.client
+        
+        if method not in ("GET", "HEAD", "POST", "PATCH", "DELETE"):
+            raise ValueError(f"Unsupported method: {method}")
         
         try:
-            if method == "GET":
-                response = requests.get(url, headers=headers)
-            elif method == "POST":
-                response = requests.post(url, headers=headers, json=data)
-            elif method == "PATCH":
-                response = requests.patch(url, headers=headers, json=data)
-            elif method == "DELETE":
-                response = requests.delete(url, headers=headers)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
-            
+            response = client.request(method, endpoint, json=data, headers=headers)
             response.raise_for_status()
             return response
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             st.error(f"Database request failed: {e}")
             raise
     
-    def get_all_tasks(self) -> List[Dict]:
-        """Get all tasks from the database"""
+    def _fetch_json(self, method: str, endpoint: str) -> List[Dict]:
+        """Make a request on the pooled client without touching Streamlit (safe in worker threads)"""
+        response = self.client.request(method, endpoint)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
+    def get_home_bundle(self) -> Tuple[List[Dict], Dict]:
+        """Fetch the first task page and the task statistics concurrently"""
+        # Both requests share the pooled HTTP/2 client, so no extra handshake is paid
+        tasks_future = _BUNDLE_POOL.submit(self._fetch_json, "GET", _HOME_TASKS)
+        stats_future = _BUNDLE_POOL.submit(self._fetch_json, "POST", "rpc/task_stats")
+        
+        # Each part falls back on its own so one failing request doesn't blank the other
         try:
-            response = self._make_request("GET", "tasks?order=created_at.desc")
-            return response.json()
+            tasks = tasks_future.result()
+        except Exception as e:
+            st.error(f"Failed to fetch tasks: {e}")
+            tasks = []
+        
+        try:
+            stats_rows = stats_future.result()
+            row = stats_rows[0] if stats_rows else {}
+            stats = stats_from_counts(row.get('total', 0), row.get('completed', 0))
+        except Exception as e:
+            st.error(f"Failed to get task statistics: {e}")
+            stats = stats_from_counts(0, 0)
+        
+        return tasks, stats
+    
+    def get_all_tasks(self, limit: int = DEFAULT_TASK_LIMIT, offset: int = 0, fields: str = TASK_FIELDS,
+                      completed: Optional[bool] = None) -> List[Dict]:
+        """Get tasks from the database, newest first, one page at a time"""
+        try:
+            endpoint = f"tasks?select={fields}&order={TASK_ORDER}&limit={limit}&offset={offset}"
+            if completed is not None:
+                # Served by the matching partial index on created_at
+                endpoint += f"&completed=eq.{str(completed).lower()}"
+            response = self._make_request("GET", endpoint)
+            return orjson.loads(response.content)
+        except Exception as e:
+            st.error(f"Failed to fetch tasks: {e}")
+            return []
+    
+    def get_tasks_page(self, cursor_created_at: Optional[str] = None, cursor_id: Optional[int] = None,
+                       limit: int = TASK_PAGE_SIZE) -> List[Dict]:
+        """Get the next page of tasks after the (created_at, id) cursor (keyset pagination)"""
+        try:
+            endpoint = f"tasks?select={TASK_FIELDS}&order={TASK_ORDER}&limit={limit}"
+            if cursor_created_at and cursor_id is not None:
+                # Quote the timestamp for the logic tree and escape its '+' offset for the query string
+                created = quote(f'"{cursor_created_at}"')
+                endpoint += f"&or=(created_at.lt.{created},and(created_at.eq.{created},id.lt.{int(cursor_id)}))"
+            response = self._make_request("GET", endpoint)
+            return orjson.loads(response.content)
         except Exception as e:
             st.error(f"Failed to fetch tasks: {e}")
             return []
@@ -65,8 +174,8 @@ class SupabaseClient:
     def get_task(self, task_id: int) -> Optional[Dict]:
         """Get a specific task by ID"""
         try:
-            response = self._make_request("GET", f"tasks?id=eq.{task_id}")
-            tasks = response.json()
+            response = self._make_request("GET", _TASK_BY_ID(int(task_id)))
+            tasks = orjson.loads(response.content)
             return tasks[0] if tasks else None
         except Exception as e:
             st.error(f"Failed to fetch task {task_id}: {e}")
@@ -81,8 +190,8 @@ class SupabaseClient:
         }
         
         try:
-            response = self._make_request("POST", "tasks", data)
-            created_task = response.json()
+            response = self._make_request("POST", _TASKS, data)
+            created_task = orjson.loads(response.content)
             return created_task[0] if isinstance(created_task, list) else created_task
         except Exception as e:
             st.error(f"Failed to create task: {e}")
@@ -97,47 +206,66 @@ class SupabaseClient:
         }
         
         try:
-            response = self._make_request("PATCH", f"tasks?id=eq.{task_id}", data)
-            updated_task = response.json()
+            response = self._make_request("PATCH", _TASK_BY_ID(int(task_id)), data)
+            updated_task = orjson.loads(response.content)
             return updated_task[0] if isinstance(updated_task, list) else updated_task
         except Exception as e:
             st.error(f"Failed to update task {task_id}: {e}")
             raise
     
-    def delete_task(self, task_id: int) -> bool:
-        """Delete a task"""
+    def delete_task(self, task_id: int) -> Optional[Dict]:
+        """Delete a task; returns the deleted row, or None if nothing was deleted"""
         try:
-            self._make_request("DELETE", f"tasks?id=eq.{task_id}")
-            return True
+            response = self._make_request("DELETE", _TASK_BY_ID(int(task_id)))
+            deleted = orjson.loads(response.content)
+            return deleted[0] if deleted else None
         except Exception as e:
             st.error(f"Failed to delete task {task_id}: {e}")
-            return False
+            return None
+    
+    def set_tasks_completed(self, task_ids: List[int], completed: bool) -> List[Dict]:
+        """Set the completed flag on several tasks in one request; returns the rows that still exist"""
+        try:
+            ids = ",".join(str(int(task_id)) for task_id in task_ids)
+            response = self._make_request("PATCH", _TASKS_BY_IDS(ids), {"completed": completed})
+            return orjson.loads(response.content)
+        except Exception as e:
+            st.error(f"Failed to update tasks {task_ids}: {e}")
+            raise
+    
+    def delete_tasks(self, task_ids: List[int]) -> List[Dict]:
+        """Delete several tasks in one request; returns the rows that were actually deleted"""
+        try:
+            ids = ",".join(str(int(task_id)) for task_id in task_ids)
+            response = self._make_request("DELETE", _TASKS_BY_IDS(ids))
+            return orjson.loads(response.content)
+        except Exception as e:
+            st.error(f"Failed to delete tasks {task_ids}: {e}")
+            raise
     
     def get_task_stats(self) -> Dict:
         """Get task statistics"""
         try:
-            tasks = self.get_all_tasks()
-            total = len(tasks)
-            completed = len([task for task in tasks if task.get('completed', False)])
-            pending = total - completed
+            # Let Postgres count instead of downloading every row
+            response = self._make_request("POST", "rpc/task_stats")
+            rows = orjson.loads(response.content)
+            row = rows[0] if rows else {}
+            total = row.get('total', 0)
+            completed = row.get('completed', 0)
             
-            return {
-                "total": total,
-                "completed": completed,
-                "pending": pending,
-                "completion_rate": (completed / total * 100) if total > 0 else 0
-            }
+            return stats_from_counts(total, completed)
         except Exception as e:
             st.error(f"Failed to get task statistics: {e}")
-            return {"total": 0, "completed": 0, "pending": 0, "completion_rate": 0}
+            return stats_from_counts(0, 0)
     
     def search_tasks(self, query: str) -> List[Dict]:
         """Search tasks by title or description"""
         try:
-            # Using ilike for case-insensitive search
-            endpoint = f"tasks?or=(title.ilike.*{query}*,description.ilike.*{query}*)&order=created_at.desc"
+            # Full-text match against the GIN-indexed search column;
+            # escape the whole term so reserved characters (&, %, commas, parentheses) stay literal
+            endpoint = _TASK_SEARCH(quote(query, safe=''))
             response = self._make_request("GET", endpoint)
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             st.error(f"Failed to search tasks: {e}")
             return []
@@ -145,21 +273,34 @@ class SupabaseClient:
     def test_connection(self) -> bool:
         """Test the database connection"""
         try:
-            response = self._make_request("GET", "tasks?limit=1")
-            return True
+            # HEAD without Prefer: count=... checks reachability without a COUNT(*) or a body
+            response = self._make_request("HEAD", "tasks?select=id&limit=0")
+            return response.status_code in (200, 206)
         except Exception as e:
             st.error(f"Database connection test failed: {e}")
             return False
 
 # Utility functions for Streamlit
-@st.cache_data(ttl=30)  # Cache for 30 seconds
-def cached_get_tasks():
+# The leading underscore on _db tells Streamlit not to hash the (resource-cached) client,
+# so entries are keyed by the remaining query parameters only
+@st.cache_data(ttl=30, show_spinner=False)  # Cache for 30 seconds
+def cached_get_tasks(_db: SupabaseClient, limit: int = DEFAULT_TASK_LIMIT, offset: int = 0,
+                     completed: Optional[bool] = None):
     """Cached version of get_all_tasks for better performance"""
-    db = SupabaseClient()
-    return db.get_all_tasks()
+    return _db.get_all_tasks(limit=limit, offset=offset, completed=completed)
 
-@st.cache_data(ttl=60)  # Cache for 1 minute
-def cached_get_stats():
+@st.cache_data(ttl=30, show_spinner=False)  # Cache for 30 seconds
+def cached_get_stats(_db: SupabaseClient):
     """Cached version of get_task_stats for better performance"""
-    db = SupabaseClient()
-    return db.get_task_stats()
+    return _db.get_task_stats()
+
+@st.cache_data(ttl=30, show_spinner=False)  # Cache for 30 seconds
+def cached_get_home_bundle(_db: SupabaseClient):
+    """Cached tasks + stats for the main page, fetched concurrently"""
+    return _db.get_home_bundle()
+
+def invalidate_task_caches():
+    """Clear every cached task read; call after create/update/delete"""
+    cached_get_tasks.clear()
+    cached_get_stats.clear()
+    cached_get_home_bundle.clear()
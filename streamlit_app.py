@@ -1,8 +1,15 @@
 import streamlit as st
 import json
+import time
+import orjson
 import requests
+from typing import Dict
 from urllib.parse import parse_qs
-from database import SupabaseClient
+from config import Config
+from database import (
+    SupabaseClient, cached_get_home_bundle, cached_get_tasks, cached_get_stats, invalidate_task_caches,
+    stats_from_counts, DEFAULT_TASK_LIMIT, TASK_PAGE_SIZE
+)
 import pandas as pd
 
 # Configure page
@@ -19,46 +26,169 @@ def init_supabase():
 
 db = init_supabase()
 
-# CORS headers for API responses
-def set_cors_headers():
-    st.markdown("""
-    <script>
-    // Set CORS headers
-    if (window.parent) {
-        window.parent.postMessage({type: 'cors', headers: {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-        }}, '*');
-    }
-    </script>
-    """, unsafe_allow_html=True)
+# Per-session copy of the task list and stats. Mutations are applied to it in place
+# so a button click doesn't refetch everything; it is reseeded from the shared
+# cache once that cache's TTL window has passed.
+TASKS_CACHE_TTL = 30
+
+def load_task_list():
+    """Seed the session task list from the cached home bundle when missing or expired"""
+    cache = st.session_state.get('tasks_cache')
+    if cache is None or time.monotonic() - cache['loaded_at'] > TASKS_CACHE_TTL:
+        tasks, stats = cached_get_home_bundle(db)
+        st.session_state.tasks_cache = {
+            'tasks': list(tasks),
+            'stats': stats,
+            'loaded_at': time.monotonic(),
+            # Keyset pagination: more pages exist only if the first one was full
+            'exhausted': len(tasks) < DEFAULT_TASK_LIMIT
+        }
+        # The reseed drops extra pages and rows deleted elsewhere; keep the
+        # multiselect's selection within its new options
+        loaded_ids = {t['id'] for t in tasks}
+        selection = st.session_state.get('bulk_selection', [])
+        st.session_state.bulk_selection = [i for i in selection if i in loaded_ids]
+    return st.session_state.tasks_cache
+
+def adjust_stats(total_delta: int, completed_delta: int):
+    """Apply a mutation's effect to the session stats without refetching"""
+    cache = st.session_state.tasks_cache
+    stats = cache['stats']
+    cache['stats'] = stats_from_counts(stats['total'] + total_delta, stats['completed'] + completed_delta)
+
+def add_task(task: Dict):
+    cache = st.session_state.tasks_cache
+    cache['tasks'].insert(0, task)
+    adjust_stats(1, int(task.get('completed', False)))
+    invalidate_task_caches()
+
+def drop_from_selection(task_id: int):
+    """Keep the bulk selection valid for the multiselect's new options"""
+    selection = st.session_state.get('bulk_selection', [])
+    st.session_state.bulk_selection = [i for i in selection if i != task_id]
+
+def toggle_task(task: Dict):
+    try:
+        # The session copy may be stale, so send only `completed` and keep newer edits intact
+        rows = db.set_tasks_completed([task['id']], not task.get('completed', False))
+        cache = st.session_state.tasks_cache
+        if rows:
+            updated = rows[0]
+            cache['tasks'] = [updated if t['id'] == task['id'] else t for t in cache['tasks']]
+            adjust_stats(0, 1 if updated.get('completed') else -1)
+        else:
+            # Deleted elsewhere; drop it locally too
+            cache['tasks'] = [t for t in cache['tasks'] if t['id'] != task['id']]
+            adjust_stats(-1, -int(task.get('completed', False)))
+            drop_from_selection(task['id'])
+        invalidate_task_caches()
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+def remove_task(task: Dict):
+    try:
+        # Count only what the database deleted; a row removed elsewhere comes back empty
+        deleted = db.delete_tasks([task['id']])
+        cache = st.session_state.tasks_cache
+        cache['tasks'] = [t for t in cache['tasks'] if t['id'] != task['id']]
+        adjust_stats(-len(deleted), -sum(1 for t in deleted if t.get('completed')))
+        invalidate_task_caches()
+        drop_from_selection(task['id'])
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+def toggle_selected_tasks():
+    """Flip the completed flag of every selected task, one PATCH per target state"""
+    cache = st.session_state.tasks_cache
+    selected_ids = set(st.session_state.bulk_selection)
+    selected = [t for t in cache['tasks'] if t['id'] in selected_ids]
+    if not selected:
+        return
+    try:
+        # Only `completed` is sent, so stale titles/descriptions are never written back
+        updated = {}
+        for target in (True, False):
+            ids = [t['id'] for t in selected if bool(t.get('completed')) != target]
+            if ids:
+                updated.update({t['id']: t for t in db.set_tasks_completed(ids, target)})
+        
+        # Rows missing from the response were deleted elsewhere; drop them locally too
+        gone = [t for t in selected if t['id'] not in updated]
+        gone_ids = {t['id'] for t in gone}
+        cache['tasks'] = [updated.get(t['id'], t) for t in cache['tasks'] if t['id'] not in gone_ids]
+        newly_done = sum(1 for t in updated.values() if t.get('completed'))
+        adjust_stats(-len(gone), newly_done - (len(updated) - newly_done)
+                     - sum(1 for t in gone if t.get('completed')))
+        invalidate_task_caches()
+        st.session_state.bulk_selection = []
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+def delete_selected_tasks():
+    """Delete every selected task with one request"""
+    cache = st.session_state.tasks_cache
+    selected = set(st.session_state.bulk_selection)
+    ids = [t['id'] for t in cache['tasks'] if t['id'] in selected]
+    if not ids:
+        return
+    try:
+        # Count only rows the database deleted; ids already removed elsewhere come back empty
+        deleted = db.delete_tasks(ids)
+        cache['tasks'] = [t for t in cache['tasks'] if t['id'] not in selected]
+        adjust_stats(-len(deleted), -sum(1 for t in deleted if t.get('completed')))
+        invalidate_task_caches()
+        st.session_state.bulk_selection = []
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+def load_more_tasks():
+    cache = st.session_state.tasks_cache
+    last = cache['tasks'][-1]
+    page = db.get_tasks_page(last['created_at'], last['id'], TASK_PAGE_SIZE)
+    cache['tasks'].extend(page)
+    cache['exhausted'] = len(page) < TASK_PAGE_SIZE
 
 # Get query parameters
 query_params = st.experimental_get_query_params()
 
+# Serialize an API response once with orjson and render it as raw JSON text
+def send_json(payload: dict):
+    st.code(orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS).decode(), language='json')
+    st.stop()
+
 # API endpoint handling
 if 'api' in query_params:
-    set_cors_headers()
     api_endpoint = query_params['api'][0]
+    response = None
     
-    # Get all tasks
-    if api_endpoint == 'tasks':
-        try:
-            tasks = db.get_all_tasks()
+    try:
+        # Get a page of tasks, newest first
+        if api_endpoint == 'tasks':
+            limit = int(query_params.get('limit', [DEFAULT_TASK_LIMIT])[0])
+            offset = int(query_params.get('offset', [0])[0])
+            limit = max(1, min(limit, Config.MAX_TASKS_PER_REQUEST))
+            offset = max(0, offset)
+            # Optional status filter, served by the pending/done partial indexes
+            status = query_params.get('completed', [None])[0]
+            completed = None if status is None else status.lower() == 'true'
+            tasks = cached_get_tasks(db, limit=limit, offset=offset, completed=completed)
             response = {
                 "status": "success",
-                "data": tasks
+                "data": tasks,
+                "limit": limit,
+                "offset": offset,
+                "completed": completed
             }
-            st.json(response)
-            st.stop()
-        except Exception as e:
-            st.json({"status": "error", "message": str(e)})
-            st.stop()
-    
-    # Get specific task
-    elif api_endpoint == 'task':
-        try:
+        
+        # Get task statistics (counted in Postgres, not from a page of tasks)
+        elif api_endpoint == 'stats':
+            response = {
+                "status": "success",
+                "data": cached_get_stats(db)
+            }
+        
+        # Get specific task
+        elif api_endpoint == 'task':
             task_id = query_params.get('id', [None])[0]
             if task_id:
                 task = db.get_task(int(task_id))
@@ -66,39 +196,28 @@ if 'api' in query_params:
                     "status": "success",
                     "data": task
                 }
-                st.json(response)
             else:
-                st.json({"status": "error", "message": "Task ID required"})
-            st.stop()
-        except Exception as e:
-            st.json({"status": "error", "message": str(e)})
-            st.stop()
-    
-    # Create task
-    elif api_endpoint == 'create_task':
-        try:
+                response = {"status": "error", "message": "Task ID required"}
+        
+        # Create task
+        elif api_endpoint == 'create_task':
             # For GET requests with parameters
             title = query_params.get('title', [None])[0]
             description = query_params.get('description', [''])[0]
             
             if title:
                 task = db.create_task(title, description)
+                invalidate_task_caches()
                 response = {
                     "status": "success",
                     "data": task,
                     "message": "Task created successfully"
                 }
-                st.json(response)
             else:
-                st.json({"status": "error", "message": "Title is required"})
-            st.stop()
-        except Exception as e:
-            st.json({"status": "error", "message": str(e)})
-            st.stop()
-    
-    # Update task
-    elif api_endpoint == 'update_task':
-        try:
+                response = {"status": "error", "message": "Title is required"}
+        
+        # Update task
+        elif api_endpoint == 'update_task':
             task_id = query_params.get('id', [None])[0]
             title = query_params.get('title', [None])[0]
             description = query_params.get('description', [''])[0]
@@ -106,26 +225,22 @@ if 'api' in query_params:
             
             if task_id and title:
                 task = db.update_task(int(task_id), title, description, completed)
+                invalidate_task_caches()
                 response = {
                     "status": "success",
                     "data": task,
                     "message": "Task updated successfully"
                 }
-                st.json(response)
             else:
-                st.json({"status": "error", "message": "Task ID and title are required"})
-            st.stop()
-        except Exception as e:
-            st.json({"status": "error", "message": str(e)})
-            st.stop()
-    
-    # Delete task
-    elif api_endpoint == 'delete_task':
-        try:
+                response = {"status": "error", "message": "Task ID and title are required"}
+        
+        # Delete task
+        elif api_endpoint == 'delete_task':
             task_id = query_params.get('id', [None])[0]
             if task_id:
-                success = db.delete_task(int(task_id))
-                if success:
+                deleted = db.delete_task(int(task_id))
+                invalidate_task_caches()
+                if deleted:
                     response = {
                         "status": "success",
                         "message": "Task deleted successfully"
@@ -135,22 +250,21 @@ if 'api' in query_params:
                         "status": "error",
                         "message": "Failed to delete task"
                     }
-                st.json(response)
             else:
-                st.json({"status": "error", "message": "Task ID required"})
-            st.stop()
-        except Exception as e:
-            st.json({"status": "error", "message": str(e)})
-            st.stop()
+                response = {"status": "error", "message": "Task ID required"}
+        
+        # Health check
+        elif api_endpoint == 'health':
+            response = {
+                "status": "success",
+                "message": "API is running",
+                "timestamp": pd.Timestamp.now().isoformat()
+            }
+    except Exception as e:
+        response = {"status": "error", "message": str(e)}
     
-    # Health check
-    elif api_endpoint == 'health':
-        st.json({
-            "status": "success",
-            "message": "API is running",
-            "timestamp": pd.Timestamp.now().isoformat()
-        })
-        st.stop()
+    if response is not None:
+        send_json(response)
 
 # Regular Streamlit Web App Interface
 else:
@@ -160,9 +274,11 @@ else:
     # Sidebar for API info
     with st.sidebar:
         st.header("API Endpoints")
-        st.markdown("""
+        st.markdown(f"""
         **Available endpoints:**
-        - `?api=tasks` - Get all tasks
+        - `?api=tasks&limit=100&offset=0` - Get a page of tasks, newest first (limit max {Config.MAX_TASKS_PER_REQUEST})
+        - `?api=tasks&completed=false` - Get only pending (or `true`: completed) tasks
+        - `?api=stats` - Get total/completed/pending counts
         - `?api=task&id=1` - Get specific task
         - `?api=create_task&title=...&description=...` - Create task
         - `?api=update_task&id=1&title=...&description=...&completed=true` - Update task
@@ -185,6 +301,9 @@ fetch(`${{API_BASE}}/?api=tasks`)
   .then(data => console.log(data));
             """)
     
+    # Session copy of tasks + stats; only refetched (concurrently) when missing or expired
+    task_cache = load_task_list()
+    
     # Main interface
     col1, col2 = st.columns([1, 1])
     
@@ -198,8 +317,8 @@ fetch(`${{API_BASE}}/?api=tasks`)
                 if title:
                     try:
                         task = db.create_task(title, description)
+                        add_task(task)
                         st.success(f"Task created: {task['title']}")
-                        st.experimental_rerun()
                     except Exception as e:
                         st.error(f"Error: {e}")
                 else:
@@ -208,18 +327,14 @@ fetch(`${{API_BASE}}/?api=tasks`)
     with col2:
         st.subheader("Task Statistics")
         try:
-            tasks = db.get_all_tasks()
-            total_tasks = len(tasks)
-            completed_tasks = len([t for t in tasks if t.get('completed', False)])
-            pending_tasks = total_tasks - completed_tasks
-            
-            st.metric("Total Tasks", total_tasks)
-            st.metric("Completed", completed_tasks)
-            st.metric("Pending", pending_tasks)
+            # Read after the create form so a just-created task is counted
+            stats = task_cache['stats']
+            st.metric("Total Tasks", stats['total'])
+            st.metric("Completed", stats['completed'])
+            st.metric("Pending", stats['pending'])
             
-            if total_tasks > 0:
-                completion_rate = (completed_tasks / total_tasks) * 100
-                st.metric("Completion Rate", f"{completion_rate:.1f}%")
+            if stats['total'] > 0:
+                st.metric("Completion Rate", f"{stats['completion_rate']:.1f}%")
         except Exception as e:
             st.error(f"Error loading statistics: {e}")
     
@@ -227,9 +342,17 @@ fetch(`${{API_BASE}}/?api=tasks`)
     st.subheader("All Tasks")
     
     try:
-        tasks = db.get_all_tasks()
-        
+        tasks = task_cache['tasks']
         if tasks:
+            with st.expander("Bulk actions"):
+                titles = {t['id']: t['title'] for t in tasks}
+                st.multiselect("Select tasks", list(titles), format_func=titles.get, key="bulk_selection")
+                bulk_col1, bulk_col2 = st.columns([1, 1])
+                with bulk_col1:
+                    st.button("Toggle selected", on_click=toggle_selected_tasks)
+                with bulk_col2:
+                    st.button("Delete selected", on_click=delete_selected_tasks)
+            
             for task in tasks:
                 with st.container():
                     col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
@@ -241,32 +364,21 @@ fetch(`${{API_BASE}}/?api=tasks`)
                             st.write(f"_{task['description']}_")
                     
                     with col2:
-                        created = pd.to_datetime(task['created_at'])
-                        st.write(f"Created: {created.strftime('%Y-%m-%d %H:%M')}")
+                        # ISO-8601 from PostgREST: slicing gives "YYYY-MM-DD HH:MM" without parsing
+                        created = task['created_at'][:16].replace('T', ' ')
+                        st.write(f"Created: {created}")
                     
                     with col3:
-                        if st.button("Toggle", key=f"toggle_{task['id']}"):
-                            try:
-                                new_status = not task.get('completed', False)
-                                db.update_task(
-                                    task['id'], 
-                                    task['title'], 
-                                    task.get('description', ''), 
-                                    new_status
-                                )
-                                st.experimental_rerun()
-                            except Exception as e:
-                                st.error(f"Error: {e}")
+                        # Callbacks run before the rerun, so the list below renders already updated
+                        st.button("Toggle", key=f"toggle_{task['id']}", on_click=toggle_task, args=(task,))
                     
                     with col4:
-                        if st.button("Delete", key=f"delete_{task['id']}"):
-                            try:
-                                db.delete_task(task['id'])
-                                st.experimental_rerun()
-                            except Exception as e:
-                                st.error(f"Error: {e}")
+                        st.button("Delete", key=f"delete_{task['id']}", on_click=remove_task, args=(task,))
                     
                     st.markdown("---")
+            
+            if not task_cache['exhausted']:
+                st.button("Load more", on_click=load_more_tasks)
         else:
             st.info("No tasks found. Create your first task!")
             